@@ -0,0 +1,81 @@
+"""
+Image-directory and JSON data file helpers shared by the scrapers and
+update-json-images.py.
+
+Kept apart from _scraper_core, which needs requests at import time, so
+scripts that only touch local files run on the standard library alone.
+"""
+
+import json
+import os
+from pathlib import Path
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def scan_images(directory):
+    """Map each file's stem to its filename with a single directory scan."""
+    try:
+        with os.scandir(directory) as entries:
+            return {os.path.splitext(entry.name)[0]: entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+def attach_images(entities, images, drop_missing=False):
+    """Point entities at their image files; returns how many have one.
+
+    images maps entity ID -> image path. With drop_missing, entities whose
+    image is gone lose their "image" key.
+    """
+    by_id = {entity.get("id", ""): entity for entity in entities}
+    matched = by_id.keys() & images.keys()
+    for entity_id in matched:
+        by_id[entity_id]["image"] = images[entity_id]
+    if drop_missing:
+        for entity_id in by_id.keys() - matched:
+            by_id[entity_id].pop("image", None)
+    return len(matched)
+
+
+def load_json(path):
+    """Parse a JSON data file."""
+    raw = Path(path).read_bytes()
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+
+def dump_json(data):
+    """Serialize data the way the checked-in files are formatted.
+
+    That is json.dumps(indent=2) output (ASCII-only) plus a trailing newline.
+    orjson only speeds up load_json: normalizing its output to this format
+    costs more than the stdlib encoder does on its own.
+    """
+    return (json.dumps(data, indent=2) + "\n").encode()
+
+
+def write_json(path, data):
+    """Write a JSON data file, skipping the write if nothing changed.
+
+    The new contents go to a temporary file that is then renamed over the
+    original, so an interrupted run never leaves a half-written data file.
+    Returns True if the file was (re)written.
+    """
+    path = Path(path)
+    new = dump_json(data)
+    try:
+        if path.read_bytes() == new:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        tmp_path.write_bytes(new)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return True
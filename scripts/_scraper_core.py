@@ -0,0 +1,790 @@
+"""
+Shared code for the wiki image scrapers.
+
+Holds the pooled requests session, an on-disk page cache (so repeated runs
+revalidate wiki HTML with ETag/Last-Modified instead of downloading it
+again, and remembers image validators so unchanged images aren't
+re-downloaded), and the image extraction and name matching helpers used by
+fetch-missing-images.py, scrape-images.py, scrape-images-v2.py and
+scrape-megabonk-wiki.py.
+"""
+
+import bisect
+import codecs
+import functools
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from pathlib import Path
+
+# Local file helpers, re-exported so the scrapers import from one place
+from _json_helpers import attach_images, dump_json, load_json, scan_images, write_json
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    print("Error: requests is required. Install with: pip install requests")
+    exit(1)
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+SCRIPT_DIR = Path(__file__).parent
+CACHE_PATH = SCRIPT_DIR / ".wiki-cache.sqlite"
+
+MAX_WORKERS = 4  # concurrent requests in flight
+
+# Politeness budget shared by every request to the wiki and its CDN
+REQUESTS_PER_SECOND = 5
+REQUEST_BURST = 2
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) MegaBonkGuide/1.0"
+
+# Cache lifetimes (seconds)
+PAGE_TTL = 24 * 60 * 60  # serve cached pages without revalidating for a day
+SEEN_TTL = 7 * 24 * 60 * 60  # skip pages that were missing or had no usable image
+IMAGE_TTL = 7 * 24 * 60 * 60  # trust a downloaded image this long before revalidating it
+
+# What download_image did with an image it didn't fail on; both are truthy
+SAVED = "saved"  # written to disk, fetched or copied from another entity's file
+UNCHANGED = "unchanged"  # the copy already on disk is current, nothing was written
+
+# Shared HTTP session: keep-alive connections to the wiki and image CDN are
+# reused across every request instead of paying a TCP+TLS handshake each time.
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": USER_AGENT})
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+
+class RateLimiter:
+    """Token bucket shared across threads.
+
+    Allows `rate` requests per second on average with bursts of up to
+    `burst`. Time spent waiting on a slow response counts toward the budget,
+    so callers only sleep when they are actually ahead of the rate.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token even if it isn't there yet; the debt reserves
+            # this caller's slot so concurrent callers queue up in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Only real network requests take a token; cache hits go straight through
+LIMITER = RateLimiter(REQUESTS_PER_SECOND, REQUEST_BURST)
+
+# Tags are matched in one C-level sweep; comments and <script> bodies are
+# consumed (and skipped) so markup inside them is ignored like HTMLParser does.
+# As in HTMLParser's attrfind, a quote only opens a value right after "=";
+# anywhere else (alt=Bob's) it is part of a bare value.
+# The last group matches an opener whose end hasn't been seen (yet).
+_IMG_TAG_RE = re.compile(
+    r'(<!--.*?-->|<script\b.*?</script\s*>)'
+    r'|<img\b((?:=\s*"[^"]*"|=\s*\'[^\']*\'|=(?!\s*["\'])|[^>=])*)>'
+    r'|(<!--|<script\b|<img\b)',
+    re.IGNORECASE | re.DOTALL,
+)
+_ATTR_RE = re.compile(r'''([^\s"'<>/=]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`][^\s>]*))''')
+
+# Fandom image URLs, names and extensions
+WIKI_IMAGE_HOST = "static.wikia.nocookie.net/megabonk/images"
+_REV_RE = re.compile(r'/revision/latest.*')
+_EXT_RE = re.compile(r'\.(png|jpg|jpeg|gif)', re.IGNORECASE)
+_NAME_URL_RE = re.compile(r'/images/\w/\w+/([^/]+)\.(png|jpg|jpeg|gif)', re.IGNORECASE)
+
+# Name normalization
+_NORM_STRIP_RE = re.compile(r'[^a-z0-9\s]')
+_WS_RE = re.compile(r'\s+')
+_PARENS_RE = re.compile(r'\s*\([^)]*\)')
+_TRAIL_NUM_RE = re.compile(r'[\s_]+\d*$')
+
+_cache_lock = threading.Lock()
+_cache_db = None
+
+
+def _cache():
+    """Open the page cache on first use."""
+    global _cache_db
+    if _cache_db is None:
+        _cache_db = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, status INTEGER, etag TEXT, "
+            "last_modified TEXT, body TEXT, fetched_at INTEGER)"
+        )
+        # Pages that came up empty (a 404, or no usable image), shared by
+        # every script so a dead end found by one isn't retried by another
+        _cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            "url TEXT PRIMARY KEY, status INTEGER, fetched_at INTEGER)"
+        )
+        # Validators for downloaded images, kept here rather than as sidecar
+        # files so nothing extra ends up next to the assets in src/images
+        _cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "path TEXT PRIMARY KEY, url TEXT, etag TEXT, "
+            "last_modified TEXT, sha256 TEXT, verified_at INTEGER)"
+        )
+        # Several entities can share one wiki image; this finds the copy
+        # already on disk instead of downloading the same bytes again
+        _cache_db.execute("CREATE INDEX IF NOT EXISTS images_url ON images (url)")
+    return _cache_db
+
+
+def _load_cached(url):
+    with _cache_lock:
+        return _cache().execute(
+            "SELECT status, etag, last_modified, body, fetched_at FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+
+def _store_cached(url, status, etag=None, last_modified=None, body=None):
+    with _cache_lock:
+        db = _cache()
+        db.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (url, status, etag, last_modified, body, int(time.time())),
+        )
+        db.commit()
+
+
+def _seen_status(url):
+    """HTTP status of a recent visit to url that came up empty, or None."""
+    with _cache_lock:
+        row = _cache().execute(
+            "SELECT status, fetched_at FROM seen WHERE url = ?", (url,)
+        ).fetchone()
+    if row and time.time() - row[1] < SEEN_TTL:
+        return row[0]
+    return None
+
+
+def seen_recently(url):
+    """True if url was a 404 or had no usable image within SEEN_TTL."""
+    return _seen_status(url) is not None
+
+
+def mark_seen(url, status=200):
+    """Remember that url came up empty so no script visits it again for a while."""
+    with _cache_lock:
+        db = _cache()
+        db.execute(
+            "INSERT OR REPLACE INTO seen VALUES (?, ?, ?)",
+            (url, status, int(time.time())),
+        )
+        db.commit()
+
+
+def _load_image_record(path):
+    with _cache_lock:
+        return _cache().execute(
+            "SELECT url, etag, last_modified, sha256, verified_at FROM images WHERE path = ?",
+            (path,),
+        ).fetchone()
+
+
+def _store_image_record(path, url, etag, last_modified, sha256, verified_at=None):
+    if verified_at is None:
+        verified_at = int(time.time())
+    with _cache_lock:
+        db = _cache()
+        db.execute(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)",
+            (path, url, etag, last_modified, sha256, verified_at),
+        )
+        db.commit()
+
+
+def _find_image_copy(url, path):
+    """A recently verified, still intact copy of url's image saved under another path.
+
+    Returns its (path, etag, last_modified, sha256, verified_at) record, or None.
+    """
+    with _cache_lock:
+        rows = _cache().execute(
+            "SELECT path, etag, last_modified, sha256, verified_at FROM images "
+            "WHERE url = ? AND path != ?",
+            (url, path),
+        ).fetchall()
+    for record in rows:
+        other, _, _, sha256, verified_at = record
+        if time.time() - verified_at >= IMAGE_TTL:
+            continue
+        try:
+            if hashlib.sha256(Path(other).read_bytes()).hexdigest() == sha256:
+                return record
+        except OSError:
+            continue
+    return None
+
+
+def _open_cached(url, stream=False):
+    """Resolve a page against the cache, going to the network only if needed.
+
+    Returns (body, None) when the cache can answer (fresh, or revalidated by a
+    304) and (None, response) for a new 200 the caller still has to read.
+    """
+    if _seen_status(url) == 404:
+        raise requests.HTTPError(f"404 Not Found (cached): {url}")
+
+    cached = _load_cached(url)
+    if cached:
+        status, etag, last_modified, body, fetched_at = cached
+        if status == 200 and time.time() - fetched_at < PAGE_TTL:
+            return body, None
+
+    headers = {}
+    if cached and cached[0] == 200:
+        if cached[1]:
+            headers["If-None-Match"] = cached[1]
+        if cached[2]:
+            headers["If-Modified-Since"] = cached[2]
+
+    LIMITER.acquire()
+    response = SESSION.get(url, headers=headers, timeout=30, stream=stream)
+
+    if response.status_code == 304 and headers:
+        response.close()
+        _, etag, last_modified, body, _ = cached
+        _store_cached(url, 200, response.headers.get("ETag", etag),
+                      response.headers.get("Last-Modified", last_modified), body)
+        return body, None
+
+    if response.status_code == 404:
+        mark_seen(url, 404)
+    if not response.ok:
+        response.close()
+        response.raise_for_status()
+    return None, response
+
+
+def _remember(url, response, body):
+    _store_cached(url, 200, response.headers.get("ETag"), response.headers.get("Last-Modified"), body)
+
+
+def fetch_cached(url):
+    """Fetch a page's HTML through the on-disk cache.
+
+    Fresh entries are returned without touching the network; stale ones are
+    revalidated with a conditional GET. Raises requests.HTTPError for any
+    non-200 result, including 404s remembered from a recent run.
+    """
+    body, response = _open_cached(url)
+    if response is None:
+        return body
+
+    body = response.content.decode('utf-8')
+    _remember(url, response, body)
+    return body
+
+
+def page_exists(url):
+    """Check whether a page exists with a HEAD request instead of a full GET.
+
+    Uses the page cache in both directions: a cached page answers True and a
+    recently seen 404 answers False without any request at all.
+    """
+    if _seen_status(url) == 404:
+        return False
+
+    cached = _load_cached(url)
+    if cached:
+        status, _, _, _, fetched_at = cached
+        if status == 200 and time.time() - fetched_at < PAGE_TTL:
+            return True
+
+    LIMITER.acquire()
+    try:
+        response = SESSION.head(url, allow_redirects=True, timeout=15)
+    except requests.RequestException:
+        return False
+    if response.status_code == 404:
+        mark_seen(url, 404)
+    return response.status_code == 200
+
+
+def stream_cached(url, chunk_size=8192):
+    """Yield a page's HTML in decoded chunks, going through the on-disk cache.
+
+    A network body is yielded as it arrives and only cached once the caller
+    has read it to the end, so a caller that has what it needs can stop early
+    and skip the rest of the download.
+    """
+    body, response = _open_cached(url, stream=True)
+    if response is None:
+        yield body
+        return
+
+    chunks = []
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with response:
+        for raw in response.iter_content(chunk_size):
+            chunk = decoder.decode(raw)
+            chunks.append(chunk)
+            yield chunk
+    chunks.append(decoder.decode(b'', final=True))
+    yield chunks[-1]
+    _remember(url, response, ''.join(chunks))
+
+
+def _scan_img_tags(html, final=True):
+    """Return the <img> attribute dicts in html and the offset to resume from.
+
+    With final=False (streamed input), scanning stops at an unterminated
+    comment, <script> or <img> tag; the resume offset points there (or at a
+    trailing partial tag) so the buffer can be rescanned once more of it has
+    arrived. With final=True the buffer is the whole page: an <img> that is
+    never closed is skipped and scanning carries on after it, while an
+    unterminated comment or <script> swallows the rest of the page.
+    """
+    tags = []
+    pos = end = 0
+    while True:
+        match = _IMG_TAG_RE.search(html, pos)
+        if not match:
+            break
+        if match.group(3):
+            if not final:
+                return tags, match.start()
+            if match.group(3)[1:].lower() != "img":
+                break
+            pos = match.end()
+            continue
+        if match.group(2) is not None:
+            attrs = {}
+            for attr in _ATTR_RE.finditer(match.group(2)):
+                value = next(v for v in attr.group(2, 3, 4) if v is not None)
+                attrs[attr.group(1).lower()] = unescape(value) if "&" in value else value
+            tags.append(attrs)
+        pos = end = match.end()
+    if final:
+        return tags, len(html)
+    partial = html.rfind("<", end)
+    return tags, partial if partial != -1 else len(html)
+
+
+def iter_img_attrs(html):
+    """Yield an attribute dict for every <img> tag in a page."""
+    tags, _ = _scan_img_tags(html)
+    yield from tags
+
+
+def iter_img_attrs_streamed(chunks):
+    """Like iter_img_attrs, but yields each tag as soon as it has arrived."""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        tags, resume = _scan_img_tags(pending, final=False)
+        yield from tags
+        pending = pending[resume:]
+    # Whatever is left never closed; scan it the way a whole page is scanned
+    tags, _ = _scan_img_tags(pending)
+    yield from tags
+
+
+def wiki_image_url(attrs):
+    """Return the full-resolution Fandom image URL of an <img> tag, or None."""
+    # Prefer data-src (lazy loaded) over src
+    img_url = attrs.get("data-src") or attrs.get("src", "")
+
+    # Filter for game entity images (not UI/icons)
+    if WIKI_IMAGE_HOST in img_url:
+        # Clean up the URL - get full resolution
+        return _REV_RE.sub('/revision/latest', img_url)
+    return None
+
+
+def extract_wiki_images(html):
+    """Extract (name, url) pairs for the game entity images on a wiki page."""
+    images = []
+    for attrs in iter_img_attrs(html):
+        img_url = wiki_image_url(attrs)
+        if img_url:
+            # Extract name from alt text or URL
+            name = attrs.get("alt") or extract_name_from_url(img_url)
+            if name:
+                images.append((name, img_url))
+    return images
+
+
+def iter_wiki_images(url):
+    """Yield the full-resolution wiki image URLs on a page while it downloads.
+
+    Callers stop at the first image they can use, which also stops the page
+    download; a page that is read to the end is kept in the on-disk cache.
+    Errors fetching the page are raised to the caller, which decides whether
+    the page was a dead end worth passing to mark_seen().
+    """
+    for attrs in iter_img_attrs_streamed(stream_cached(url)):
+        img_url = wiki_image_url(attrs)
+        if img_url:
+            yield img_url
+
+
+def extract_name_from_url(url):
+    """Extract entity name from image URL."""
+    # URL pattern: .../images/X/XX/Name.png/...
+    match = _NAME_URL_RE.search(url)
+    if match:
+        name = match.group(1)
+        # Clean up name
+        name = name.replace("_", " ").replace("-", " ")
+        return name
+    return None
+
+
+def image_ext(url):
+    """File extension to save an image URL under."""
+    ext_match = _EXT_RE.search(url)
+    return ext_match.group(1).lower() if ext_match else "png"
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_name(name):
+    """Normalize a name for matching."""
+    if not name:
+        return ""
+    normalized = name.lower().strip()
+    # Remove special characters but keep spaces
+    normalized = _NORM_STRIP_RE.sub('', normalized)
+    # Collapse multiple spaces
+    normalized = _WS_RE.sub(' ', normalized)
+    return normalized
+
+
+@functools.lru_cache(maxsize=2048)
+def create_name_variants(name):
+    """Create multiple variants of a name for matching.
+
+    Results are memoized (the same names come up for every entity type and
+    image), so a frozenset is returned; union it rather than updating it.
+    """
+    variants = set()
+
+    # Original
+    variants.add(normalize_name(name))
+
+    # Without common suffixes
+    for suffix in [' icon', ' img', ' image', ' item', ' weapon', ' tome', ' char']:
+        variants.add(normalize_name(name.replace(suffix, '')))
+
+    # ID form (underscores)
+    id_form = normalize_name(name).replace(' ', '_')
+    variants.add(id_form)
+
+    # Without parentheses content
+    no_parens = _PARENS_RE.sub('', name)
+    variants.add(normalize_name(no_parens))
+
+    # Handle "X's Y" -> "xs y"
+    no_apostrophe = name.replace("'s", "s").replace("'", "")
+    variants.add(normalize_name(no_apostrophe))
+
+    # Remove trailing numbers/underscores
+    clean = _TRAIL_NUM_RE.sub('', normalize_name(name))
+    variants.add(clean)
+
+    # Remove leading/trailing underscores or spaces from variants
+    return frozenset(v.strip('_ ') for v in variants if v.strip('_ '))
+
+
+def _trie_pattern(words):
+    """Regex source matching any of words, factored as a character trie.
+
+    Python's re tries alternatives one by one, so a flat name1|name2|...
+    costs as much as testing each name; a trie has one branch per next
+    character and matches in a single pass. Greedy, so at a given position
+    it matches the longest word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and "" not in node else "(?:" + "|".join(branches) + ")"
+        return body + ("?" if "" in node else "")
+
+    return build(trie)
+
+
+class NameMatcher:
+    """Index of entity name variants for matching image names.
+
+    Exact lookups go through name_to_id. The partial match (an entity name
+    inside the image name or the other way round, both longer than 3
+    characters) is answered from indexes built once per entity type instead
+    of scanning every name per image: an Aho-Corasick automaton when
+    pyahocorasick is installed (otherwise a trie-shaped regex), and one
+    str.find over all names joined together for the reverse direction. Ties
+    go to the first name added, exactly like the linear scan this replaces.
+    """
+
+    def __init__(self, name_to_id):
+        self.name_to_id = name_to_id
+        self._long = [(name, entity_id) for name, entity_id in name_to_id.items() if len(name) > 3]
+
+        # Names joined with a separator no normalized name contains, plus the
+        # offset each name starts at so a find() hit maps back to its index
+        self._joined = "\n".join(name for name, _ in self._long)
+        self._starts = []
+        offset = 0
+        for name, _ in self._long:
+            self._starts.append(offset)
+            offset += len(name) + 1
+
+        self._automaton = None
+        self._pattern = None
+        self._index = {name: index for index, (name, _) in enumerate(self._long)}
+        if HAS_AHOCORASICK and self._long:
+            self._automaton = ahocorasick.Automaton()
+            for index, (name, _) in enumerate(self._long):
+                self._automaton.add_word(name, index)
+            self._automaton.make_automaton()
+        elif self._long:
+            # Lookahead so a match is reported at every position, overlaps included
+            self._pattern = re.compile("(?=(" + _trie_pattern(self._index) + "))")
+
+    def get(self, name):
+        return self.name_to_id.get(name)
+
+    def partial_match(self, normalized):
+        """Entity ID whose name contains, or is contained in, a normalized name."""
+        if len(normalized) <= 3 or not self._long:
+            return None
+
+        # Entity names inside the image name
+        if self._automaton is not None:
+            hits = [index for _, index in self._automaton.iter(normalized)]
+        else:
+            # The longest name starting at each position; any shorter name
+            # starting there is one of its prefixes
+            hits = [
+                self._index[longest[:end]]
+                for longest in self._pattern.findall(normalized)
+                for end in range(4, len(longest) + 1)
+                if longest[:end] in self._index
+            ]
+        best = min(hits, default=len(self._long))
+
+        # Image name inside an entity name: the first hit in the joined string
+        # is the earliest such name
+        pos = self._joined.find(normalized)
+        if pos != -1:
+            best = min(best, bisect.bisect_right(self._starts, pos) - 1)
+
+        return self._long[best][1] if best < len(self._long) else None
+
+
+def warn(message):
+    """Print one line to stderr.
+
+    Pages and images are fetched on worker threads; writing the line and its
+    newline in a single call keeps concurrent messages on separate lines.
+    """
+    sys.stderr.write(message + "\n")
+
+
+def fetch_page(url):
+    """Fetch a web page and return its content, or None after reporting why."""
+    try:
+        return fetch_cached(url)
+    except Exception as e:
+        warn(f"  Error fetching {url}: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def listing_images(url):
+    """The (name, url) images on a wiki listing page, or None if it can't be fetched.
+
+    Parsed once per process, so every scraper run from the same pipeline
+    shares one read of each (large) listing page.
+    """
+    html = fetch_page(url)
+    if html is None:
+        return None
+    return tuple(extract_wiki_images(html))
+
+
+def fetch_listing_images(base_url, wiki_pages):
+    """Fetch and parse every wiki listing page concurrently, keyed like wiki_pages."""
+    urls = [base_url + wiki_path for wiki_path in wiki_pages.values()]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return dict(zip(wiki_pages, executor.map(listing_images, urls)))
+
+
+def download_image(url, save_path, verbose=True, reject=None):
+    """Download an image and save it to disk.
+
+    An image previously saved from the same URL is not fetched again while it
+    is still intact: within IMAGE_TTL of its last check nothing is requested
+    at all, after that a conditional GET lets an unchanged image come back as
+    a 304. If the same URL was recently saved for another entity, that file
+    is copied instead of downloading the bytes again.
+
+    reject, if given, is called with the image's size in bytes and returns
+    True for images that should not be saved (placeholders and the like).
+    The advertised size is checked before the body is read. A rejected URL
+    is marked as seen and skipped by later runs.
+
+    Returns SAVED if the image was written, UNCHANGED if the file on disk
+    was already current, and False if nothing usable was found.
+    """
+    if reject is not None and seen_recently(url):
+        return False
+
+    key = str(save_path.resolve())
+    record = _load_image_record(key)
+    headers = {}
+    if record and record[0] == url and save_path.exists():
+        _, etag, last_modified, sha256, verified_at = record
+        if hashlib.sha256(save_path.read_bytes()).hexdigest() == sha256:
+            if time.time() - verified_at < IMAGE_TTL:
+                return UNCHANGED
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+    part_path = save_path.with_name(save_path.name + ".part")
+    try:
+        copy = None if headers else _find_image_copy(url, key)
+        if copy:
+            # A plain copy rather than a link, so tools that rewrite one
+            # image in place never change another entity's image too
+            other, etag, last_modified, sha256, verified_at = copy
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(other, part_path)
+            os.replace(part_path, save_path)
+            _store_image_record(key, url, etag, last_modified, sha256, verified_at)
+            return SAVED
+
+        LIMITER.acquire()
+        with SESSION.get(url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304 and headers:
+                _store_image_record(key, url, response.headers.get("ETag", etag),
+                                    response.headers.get("Last-Modified", last_modified), sha256)
+                return UNCHANGED
+            response.raise_for_status()
+
+            # Check the advertised size before reading the body, so rejected
+            # images cost only their headers
+            length = response.headers.get("Content-Length", "")
+            if (reject is not None and length.isdigit()
+                    and "Content-Encoding" not in response.headers and reject(int(length))):
+                mark_seen(url)
+                return False
+
+            # Ensure directory exists
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # Stream to a temporary file so a dropped connection never leaves
+            # a truncated image behind that later runs would treat as done
+            digest = hashlib.sha256()
+            size = 0
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        if reject is not None and reject(size):
+            part_path.unlink()
+            mark_seen(url)
+            return False
+        os.replace(part_path, save_path)
+        _store_image_record(key, url, response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"), digest.hexdigest())
+        return SAVED
+    except Exception as e:
+        part_path.unlink(missing_ok=True)
+        if verbose:
+            warn(f"  Error downloading {url}: {e}")
+        return False
+
+
+def download_first(candidates, verbose=True, download=download_image):
+    """Try candidate images in order until one downloads.
+
+    Each candidate is a tuple starting with (url, save_path); anything after
+    that is carried along for the caller. download is called as
+    download(url, save_path, verbose) and defaults to download_image.
+    Returns the index of the candidate that was saved and download's result
+    for it, or (None, False).
+    """
+    for index, (url, save_path, *_) in enumerate(candidates):
+        result = download(url, save_path, verbose)
+        if result:
+            return index, result
+    return None, False
+
+
+def download_all(candidates_by_key, verbose=True, download=download_image):
+    """Run download_first for every key's candidates concurrently.
+
+    Returns {key: (index, result)} as download_first gives them, in the same
+    order as candidates_by_key.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            key: executor.submit(download_first, candidates, verbose, download)
+            for key, candidates in candidates_by_key.items()
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
+def download_and_report(candidates_by_key, label="", download=download_image):
+    """Download an image for every key and print each one that was saved.
+
+    candidates_by_key maps an entity ID to its matching (url, save_path,
+    name) tuples in page order. Each entity's candidates are tried in turn
+    while different entities download in parallel. Images written to disk
+    are printed as "<label><name> -> <filename>"; ones whose file was already
+    current are not. Returns the IDs whose image was written.
+    """
+    saved = []
+    for key, (index, result) in download_all(candidates_by_key, download=download).items():
+        if result == SAVED:
+            _, save_path, name = candidates_by_key[key][index]
+            print(f"  {label}{name} -> {save_path.name}")
+            saved.append(key)
+    return saved
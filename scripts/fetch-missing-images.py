@@ -3,13 +3,26 @@
 Fetch remaining missing images from multiple sources.
 """
 
-import os
-import re
-import json
-import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from html.parser import HTMLParser
+from urllib.parse import unquote
+
+from _scraper_core import (
+    MAX_WORKERS,
+    attach_images,
+    create_name_variants,
+    download_first,
+    download_image,
+    image_ext,
+    iter_wiki_images,
+    listing_images,
+    load_json,
+    mark_seen,
+    page_exists,
+    scan_images,
+    seen_recently,
+    write_json,
+)
 
 BASE_URL = "https://megabonk.fandom.com"
 SCRIPT_DIR = Path(__file__).parent
@@ -17,7 +30,11 @@ PROJECT_DIR = SCRIPT_DIR.parent
 DATA_DIR = PROJECT_DIR / "data"
 IMAGES_DIR = PROJECT_DIR / "src" / "images"
 
-DELAY = 0.3
+LISTING_PAGES = {
+    "items": "/wiki/Items",
+    "weapons": "/wiki/Weapons",
+    "tomes": "/wiki/Tomes",
+}
 
 # Missing items with possible wiki page names to try
 MISSING_ITEMS = {
@@ -59,64 +76,45 @@ MISSING_TOMES = {
 }
 
 
-class ImageExtractor(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.images = []
-
-    def handle_starttag(self, tag, attrs):
-        if tag == "img":
-            attrs_dict = dict(attrs)
-            src = attrs_dict.get("data-src", attrs_dict.get("src", ""))
-            if "static.wikia.nocookie.net/megabonk/images" in src:
-                # Get full resolution
-                src = re.sub(r'/revision/latest.*', '/revision/latest', src)
-                self.images.append(src)
-
-
-def fetch_page(url):
-    headers = {"User-Agent": "Mozilla/5.0 MegaBonkGuide/1.0"}
-    request = urllib.request.Request(url, headers=headers)
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            return response.read().decode('utf-8')
-    except:
-        return None
-
-
-def download_image(url, save_path):
-    headers = {"User-Agent": "Mozilla/5.0 MegaBonkGuide/1.0"}
-    request = urllib.request.Request(url, headers=headers)
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            data = response.read()
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(save_path, 'wb') as f:
-                f.write(data)
-            return True
-    except Exception as e:
-        return False
+def search_listing(entity_id, page_names, listing, output_dir):
+    """Look for the image among those on the entity type's listing page."""
+    wanted = create_name_variants(entity_id.replace("_", " "))
+    for page_name in page_names:
+        wanted |= create_name_variants(unquote(page_name).replace("_", " "))
+
+    candidates = [
+        (img_url, output_dir / f"{entity_id}.{image_ext(img_url)}")
+        for img_name, img_url in listing
+        if create_name_variants(img_name) & wanted
+    ]
+    index, _ = download_first(candidates, verbose=False)
+    return index is not None
 
 
 def try_fetch_from_wiki(entity_id, page_names, output_dir):
     """Try multiple wiki page names to find an image."""
     for page_name in page_names:
         url = f"{BASE_URL}/wiki/{page_name}"
-        html = fetch_page(url)
-        if html:
-            parser = ImageExtractor()
-            parser.feed(html)
-
-            # Get first suitable image (skip tiny icons)
-            for img_url in parser.images:
-                if img_url:
-                    ext_match = re.search(r'\.(png|jpg|jpeg|gif)', img_url, re.IGNORECASE)
-                    ext = ext_match.group(1).lower() if ext_match else "png"
-                    save_path = output_dir / f"{entity_id}.{ext}"
-
-                    if download_image(img_url, save_path):
-                        return True
-        time.sleep(DELAY)
+        if seen_recently(url):
+            continue
+
+        # Get first suitable image (skip tiny icons)
+        offered = False
+        try:
+            for img_url in iter_wiki_images(url):
+                offered = True
+                save_path = output_dir / f"{entity_id}.{image_ext(img_url)}"
+
+                if download_image(img_url, save_path, verbose=False):
+                    return True
+        except Exception:
+            # Couldn't fetch the page; try again next run
+            continue
+
+        # Only a page without any images is a dead end; failed downloads
+        # may just have been a flaky connection
+        if not offered:
+            mark_seen(url)
     return False
 
 
@@ -129,117 +127,126 @@ def search_in_gallery(entity_name, output_dir, entity_id):
         entity_name.replace("'", "").replace(" ", "_"),
     ]
 
+    # File: namespace pages to probe; the .png page must show an image named after
+    # the term, any image on the .jpg page will do
+    probes = {}
     for term in search_terms:
-        # Try File: namespace
-        url = f"{BASE_URL}/wiki/File:{term}.png"
-        html = fetch_page(url)
-        if html:
-            parser = ImageExtractor()
-            parser.feed(html)
-            for img_url in parser.images:
-                if term.lower() in img_url.lower():
-                    ext_match = re.search(r'\.(png|jpg|jpeg|gif)', img_url, re.IGNORECASE)
-                    ext = ext_match.group(1).lower() if ext_match else "png"
-                    save_path = output_dir / f"{entity_id}.{ext}"
-                    if download_image(img_url, save_path):
-                        return True
-        time.sleep(DELAY)
-
-        # Also try .jpg
-        url = f"{BASE_URL}/wiki/File:{term}.jpg"
-        html = fetch_page(url)
-        if html:
-            parser = ImageExtractor()
-            parser.feed(html)
-            for img_url in parser.images:
-                ext_match = re.search(r'\.(png|jpg|jpeg|gif)', img_url, re.IGNORECASE)
-                ext = ext_match.group(1).lower() if ext_match else "png"
-                save_path = output_dir / f"{entity_id}.{ext}"
-                if download_image(img_url, save_path):
+        probes.setdefault(f"{BASE_URL}/wiki/File:{term}.png", term.lower())
+        probes.setdefault(f"{BASE_URL}/wiki/File:{term}.jpg", None)
+    probes = {url: required for url, required in probes.items() if not seen_recently(url)}
+
+    # Check which pages exist with concurrent HEAD requests before reading any
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        exists = dict(zip(probes, executor.map(page_exists, probes)))
+
+    for url, required in probes.items():
+        if not exists[url]:
+            continue
+        offered = False
+        try:
+            for img_url in iter_wiki_images(url):
+                if required and required not in img_url.lower():
+                    continue
+                offered = True
+                save_path = output_dir / f"{entity_id}.{image_ext(img_url)}"
+                if download_image(img_url, save_path, verbose=False):
                     return True
-        time.sleep(DELAY)
+        except Exception:
+            continue
+
+        # No image named after the term (or none at all) is a dead end
+        if not offered:
+            mark_seen(url)
 
     return False
 
 
-def main():
-    print("="*60)
-    print("Fetching Missing Images")
-    print("="*60)
+def find_image(entity_id, page_names, output_dir, listing):
+    """Look for an entity's image on the listing page, its wiki pages, then in the file gallery."""
+    # Try the listing page, already fetched and parsed
+    if listing and search_listing(entity_id, page_names, listing, output_dir):
+        return "✓ Found on listing page!"
 
-    total = 0
+    # Try wiki pages
+    if try_fetch_from_wiki(entity_id, page_names, output_dir):
+        return "✓ Found!"
 
-    # Items
-    print(f"\nITEMS ({len(MISSING_ITEMS)} to find):")
-    output_dir = IMAGES_DIR / "items"
-    for entity_id, page_names in MISSING_ITEMS.items():
-        # Check if already exists
-        existing = list(output_dir.glob(f"{entity_id}.*"))
-        if existing:
-            continue
+    # Try file gallery
+    entity_name = page_names[0].replace("_", " ")
+    if search_in_gallery(entity_name, output_dir, entity_id):
+        return "✓ Found in gallery!"
 
-        print(f"  Searching for {entity_id}...", end=" ")
+    return None
 
-        # Try wiki pages
-        if try_fetch_from_wiki(entity_id, page_names, output_dir):
-            print("✓ Found!")
-            total += 1
-            continue
 
-        # Try file gallery
-        entity_name = page_names[0].replace("_", " ")
-        if search_in_gallery(entity_name, output_dir, entity_id):
-            print("✓ Found in gallery!")
-            total += 1
-            continue
+def fetch_missing(label, missing, output_dir, listing_path):
+    """Search for every missing entity of one type, a few entities at a time."""
+    print(f"\n{label} ({len(missing)} to find):")
 
-        print("✗ Not found")
+    # Check which ones already exist
+    existing = scan_images(output_dir)
+    todo = {
+        entity_id: page_names
+        for entity_id, page_names in missing.items()
+        if entity_id not in existing
+    }
 
-    # Weapons
-    print(f"\nWEAPONS ({len(MISSING_WEAPONS)} to find):")
-    output_dir = IMAGES_DIR / "weapons"
-    for entity_id, page_names in MISSING_WEAPONS.items():
-        existing = list(output_dir.glob(f"{entity_id}.*"))
-        if existing:
-            continue
+    # Shared with the listing scrapers when run from the same pipeline
+    listing = listing_images(BASE_URL + listing_path) if todo else None
 
-        print(f"  Searching for {entity_id}...", end=" ")
+    found = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            entity_id: executor.submit(find_image, entity_id, page_names, output_dir, listing)
+            for entity_id, page_names in todo.items()
+        }
+        # Report in table order as results come in
+        for entity_id, future in futures.items():
+            result = future.result()
+            print(f"  Searching for {entity_id}... {result or '✗ Not found'}")
+            if result:
+                found += 1
 
-        if try_fetch_from_wiki(entity_id, page_names, output_dir):
-            print("✓ Found!")
-            total += 1
-            continue
+    return found
 
-        entity_name = page_names[0].replace("_", " ")
-        if search_in_gallery(entity_name, output_dir, entity_id):
-            print("✓ Found in gallery!")
-            total += 1
-            continue
 
-        print("✗ Not found")
+def run():
+    """Search for every entity in the MISSING_* tables; returns how many were found."""
+    total = 0
+    total += fetch_missing("ITEMS", MISSING_ITEMS, IMAGES_DIR / "items", LISTING_PAGES["items"])
+    total += fetch_missing("WEAPONS", MISSING_WEAPONS, IMAGES_DIR / "weapons", LISTING_PAGES["weapons"])
+    total += fetch_missing("TOMES", MISSING_TOMES, IMAGES_DIR / "tomes", LISTING_PAGES["tomes"])
+    return total
 
-    # Tomes
-    print(f"\nTOMES ({len(MISSING_TOMES)} to find):")
-    output_dir = IMAGES_DIR / "tomes"
-    for entity_id, page_names in MISSING_TOMES.items():
-        existing = list(output_dir.glob(f"{entity_id}.*"))
-        if existing:
-            continue
 
-        print(f"  Searching for {entity_id}...", end=" ")
+def update_json_files():
+    """Point entities that now have an image at it in the JSON data files."""
+    print("\nUpdating JSON files...")
+    for entity_type in ["items", "weapons", "tomes"]:
+        json_path = DATA_DIR / f"{entity_type}.json"
+        img_dir = IMAGES_DIR / entity_type
 
-        if try_fetch_from_wiki(entity_id, page_names, output_dir):
-            print("✓ Found!")
-            total += 1
-            continue
+        data = load_json(json_path)
+
+        images = {
+            stem: f"images/{entity_type}/{filename}"
+            for stem, filename in scan_images(img_dir).items()
+        }
+
+        attach_images(data.get(entity_type, []), images)
+
+        if write_json(json_path, data):
+            print(f"  Updated {entity_type}.json")
+        else:
+            print(f"  {entity_type}.json already up to date")
 
-        entity_name = page_names[0].replace("_", " ")
-        if search_in_gallery(entity_name, output_dir, entity_id):
-            print("✓ Found in gallery!")
-            total += 1
-            continue
 
-        print("✗ Not found")
+def main():
+    print("="*60)
+    print("Fetching Missing Images")
+    print("="*60)
+
+    total = run()
 
     print(f"\n{'='*60}")
     print(f"Found {total} additional images")
@@ -247,28 +254,7 @@ def main():
 
     # Update JSON
     if total > 0:
-        print("\nUpdating JSON files...")
-        for entity_type in ["items", "weapons", "tomes"]:
-            json_path = DATA_DIR / f"{entity_type}.json"
-            img_dir = IMAGES_DIR / entity_type
-
-            with open(json_path, 'r') as f:
-                data = json.load(f)
-
-            images = {}
-            for img_file in img_dir.iterdir():
-                if img_file.is_file():
-                    images[img_file.stem] = f"images/{entity_type}/{img_file.name}"
-
-            for entity in data.get(entity_type, []):
-                entity_id = entity.get("id", "")
-                if entity_id in images:
-                    entity["image"] = images[entity_id]
-
-            with open(json_path, 'w') as f:
-                json.dump(data, f, indent=2)
-
-            print(f"  Updated {entity_type}.json")
+        update_json_files()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Precompress the guide's text assets for serve.py.
+
+Writes a .gz (and, if the brotli package is installed, a .br) copy of every
+.html/.js/.css/.json/.svg file under src/ into .precompressed/, mirroring
+src/'s layout. serve.py sends these to browsers that accept the encoding
+instead of the raw file. Images are skipped since PNG/WebP/JPEG are already
+compressed.
+
+The copies live outside src/ and data/ so the production build, which
+copies data/, images/ and icons/ into dist/, never ships them.
+
+Re-run after changing assets; serve.py ignores compressed files older than
+their source, so a stale one is never served.
+"""
+
+import gzip
+import os
+from pathlib import Path
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+PROJECT_DIR = Path(__file__).parent.parent
+SRC_DIR = PROJECT_DIR / 'src'
+OUT_DIR = PROJECT_DIR / '.precompressed'
+EXTENSIONS = ('.html', '.js', '.css', '.json', '.svg')
+
+
+def compress(path, out_path, encode):
+    """Write out_path from encode(bytes) unless it is already up to date."""
+    if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path):
+        return False
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(encode(data))
+    return True
+
+
+def main():
+    print("=" * 40)
+    print("Precompressing assets")
+    print("=" * 40)
+
+    if not HAS_BROTLI:
+        print("Tip: Install 'brotli' for .br files too: pip install brotli")
+
+    written = 0
+    skipped = 0
+
+    # src/data is a symlink to the data files, so follow links
+    for root, _, files in os.walk(SRC_DIR, followlinks=True):
+        for name in sorted(files):
+            if not name.endswith(EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, SRC_DIR)
+            out_path = os.path.join(OUT_DIR, rel_path)
+
+            # Earlier versions wrote the copies next to the source, where the
+            # build would pick them up
+            for suffix in ('.gz', '.br'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+            # mtime=0 keeps the .gz output identical between runs
+            outputs = [compress(path, out_path + '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if HAS_BROTLI:
+                outputs.append(compress(path, out_path + '.br', lambda data: brotli.compress(data, quality=11)))
+
+            if any(outputs):
+                print(f"OK: {rel_path}")
+                written += 1
+            else:
+                skipped += 1
+
+    print("-" * 40)
+    print(f"Done: {written} compressed, {skipped} already up to date")
+
+
+if __name__ == '__main__':
+    main()
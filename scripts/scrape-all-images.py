@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+MegaBonk Image Pipeline
+Runs the Fandom Wiki scrapers back to back in one process.
+
+scrape-images-v2.py goes first (listing pages plus individual-page fallback),
+then fetch-missing-images.py searches for whatever is still missing. Both
+share one HTTP session and page cache, so pages either of them needs are
+fetched once (listing pages are parsed once too), and the JSON data files
+are updated a single time at the end.
+"""
+
+import importlib.util
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+
+
+def load_script(filename):
+    """Import one of the hyphenated scraper scripts as a module."""
+    module_name = filename.removesuffix(".py").replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    print("="*60)
+    print("MegaBonk Image Pipeline")
+    print("="*60)
+
+    scrape_v2 = load_script("scrape-images-v2.py")
+    fetch_missing = load_script("fetch-missing-images.py")
+
+    downloaded = scrape_v2.run()
+    found = fetch_missing.run()
+
+    print(f"\n{'='*60}")
+    print(f"Downloaded {downloaded} new images, found {found} more by search")
+    print(f"{'='*60}")
+
+    # Update JSON files
+    scrape_v2.update_json_with_images()
+
+    # Show final counts
+    scrape_v2.print_image_counts()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,26 @@ MegaBonk Image Scraper v2 - Improved matching
 Downloads images from the Fandom Wiki with better name matching.
 """
 
-import os
-import re
-import json
-import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from html.parser import HTMLParser
+
+from _scraper_core import (
+    MAX_WORKERS,
+    NameMatcher,
+    attach_images,
+    create_name_variants,
+    download_and_report,
+    extract_wiki_images,
+    fetch_listing_images,
+    fetch_page,
+    image_ext,
+    load_json,
+    mark_seen,
+    normalize_name,
+    scan_images,
+    seen_recently,
+    write_json,
+)
 
 # Configuration
 BASE_URL = "https://megabonk.fandom.com"
@@ -27,147 +40,15 @@ PROJECT_DIR = SCRIPT_DIR.parent
 DATA_DIR = PROJECT_DIR / "data"
 IMAGES_DIR = PROJECT_DIR / "src" / "images"
 
-# Rate limiting
-DELAY_BETWEEN_REQUESTS = 0.3
-
-
-class WikiImageParser(HTMLParser):
-    """Parse wiki page to extract image URLs and names."""
-
-    def __init__(self):
-        super().__init__()
-        self.images = []
-        self.in_table = False
-        self.in_link = False
-        self.current_link_text = ""
-        self.current_image = None
-
-    def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
-
-        if tag == "a":
-            self.in_link = True
-            self.current_link_text = ""
-
-        if tag == "img":
-            src = attrs_dict.get("src", "")
-            alt = attrs_dict.get("alt", "")
-            data_src = attrs_dict.get("data-src", "")
-
-            img_url = data_src if data_src else src
-
-            if "static.wikia.nocookie.net/megabonk/images" in img_url:
-                # Get full resolution
-                img_url = re.sub(r'/revision/latest.*', '/revision/latest', img_url)
-                name = alt if alt else self._extract_name_from_url(img_url)
-                if name and img_url:
-                    self.images.append((name, img_url))
-
-    def handle_data(self, data):
-        if self.in_link:
-            self.current_link_text += data
-
-    def handle_endtag(self, tag):
-        if tag == "a":
-            self.in_link = False
-
-    def _extract_name_from_url(self, url):
-        match = re.search(r'/images/\w/\w+/([^/]+)\.(png|jpg|jpeg|gif)', url, re.IGNORECASE)
-        if match:
-            name = match.group(1)
-            name = name.replace("_", " ").replace("-", " ")
-            return name
-        return None
-
-
-def normalize_name(name):
-    """Normalize a name for matching."""
-    if not name:
-        return ""
-    normalized = name.lower().strip()
-    # Remove special characters but keep spaces
-    normalized = re.sub(r'[^a-z0-9\s]', '', normalized)
-    # Collapse multiple spaces
-    normalized = re.sub(r'\s+', ' ', normalized)
-    return normalized
-
-
-def create_name_variants(name):
-    """Create multiple variants of a name for matching."""
-    variants = set()
-
-    # Original
-    variants.add(normalize_name(name))
-
-    # Without common suffixes
-    for suffix in [' icon', ' img', ' image', ' item', ' weapon', ' tome', ' char']:
-        variants.add(normalize_name(name.replace(suffix, '')))
-
-    # ID form (underscores)
-    id_form = normalize_name(name).replace(' ', '_')
-    variants.add(id_form)
-
-    # Without parentheses content
-    no_parens = re.sub(r'\s*\([^)]*\)', '', name)
-    variants.add(normalize_name(no_parens))
-
-    # Handle "X's Y" -> "xs y"
-    no_apostrophe = name.replace("'s", "s").replace("'", "")
-    variants.add(normalize_name(no_apostrophe))
-
-    # Remove trailing numbers/underscores
-    clean = re.sub(r'[\s_]+\d*$', '', normalize_name(name))
-    variants.add(clean)
-
-    # Remove leading/trailing underscores or spaces from variants
-    variants = {v.strip('_ ') for v in variants if v.strip('_ ')}
-
-    return variants
-
-
-def fetch_page(url):
-    """Fetch a web page and return its content."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) MegaBonkGuide/1.0"
-    }
-    request = urllib.request.Request(url, headers=headers)
-
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            return response.read().decode('utf-8')
-    except Exception as e:
-        print(f"  Error fetching {url}: {e}")
-        return None
-
-
-def download_image(url, save_path):
-    """Download an image and save it to disk."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) MegaBonkGuide/1.0"
-    }
-    request = urllib.request.Request(url, headers=headers)
-
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            data = response.read()
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(save_path, 'wb') as f:
-                f.write(data)
-            return True
-    except Exception as e:
-        print(f"  Error downloading {url}: {e}")
-        return False
-
 
 def load_entities(entity_type):
     """Load entities from JSON and create name mappings."""
     json_file = DATA_DIR / f"{entity_type}.json"
 
     if not json_file.exists():
-        return {}, []
+        return NameMatcher({}), []
 
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+    data = load_json(json_file)
 
     entities = data.get(entity_type, [])
 
@@ -175,11 +56,8 @@ def load_entities(entity_type):
     name_to_id = {}
     missing_ids = []
 
-    # Check what images we already have
-    img_dir = IMAGES_DIR / entity_type
-    existing = set()
-    if img_dir.exists():
-        existing = {f.stem for f in img_dir.iterdir() if f.is_file()}
+    # Check what images we already have (one directory scan for all entities)
+    existing = scan_images(IMAGES_DIR / entity_type)
 
     for entity in entities:
         entity_id = entity.get("id", "")
@@ -192,41 +70,35 @@ def load_entities(entity_type):
         missing_ids.append(entity_id)
 
         # Create all name variants and map them to this ID
-        variants = create_name_variants(entity_name)
-        variants.update(create_name_variants(entity_id.replace('_', ' ')))
+        variants = create_name_variants(entity_name) | create_name_variants(entity_id.replace('_', ' '))
 
         for variant in variants:
             if variant and variant not in name_to_id:
                 name_to_id[variant] = entity_id
 
-    return name_to_id, missing_ids
+    return NameMatcher(name_to_id), missing_ids
 
 
-def match_image_to_entity(img_name, name_to_id):
+def match_image_to_entity(img_name, matcher):
     """Try to match an image name to an entity ID."""
     variants = create_name_variants(img_name)
 
     for variant in variants:
-        if variant in name_to_id:
-            return name_to_id[variant]
+        entity_id = matcher.get(variant)
+        if entity_id:
+            return entity_id
 
     # Try partial matching for longer names
-    normalized = normalize_name(img_name)
-    for name, entity_id in name_to_id.items():
-        if len(name) > 3 and len(normalized) > 3:
-            if name in normalized or normalized in name:
-                return entity_id
-
-    return None
+    return matcher.partial_match(normalize_name(img_name))
 
 
-def scrape_entity_type(entity_type, wiki_path):
+def scrape_entity_type(entity_type, wiki_path, images):
     """Scrape images for a specific entity type."""
     print(f"\n{'='*60}")
     print(f"Scraping {entity_type.upper()}")
     print(f"{'='*60}")
 
-    name_to_id, missing_ids = load_entities(entity_type)
+    matcher, missing_ids = load_entities(entity_type)
 
     if not missing_ids:
         print(f"  All images already downloaded!")
@@ -234,17 +106,14 @@ def scrape_entity_type(entity_type, wiki_path):
 
     print(f"  Missing {len(missing_ids)} images")
 
-    # Fetch main wiki page
+    # Main wiki page is fetched and parsed up front by fetch_listing_images()
     url = BASE_URL + wiki_path
-    print(f"  Fetching: {url}")
-
-    html = fetch_page(url)
-    if not html:
+    if images is None:
+        print(f"  Failed to fetch {url}")
         return 0
+    print(f"  Fetched: {url}")
 
-    parser = WikiImageParser()
-    parser.feed(html)
-    print(f"  Found {len(parser.images)} images on page")
+    print(f"  Found {len(images)} images on page")
 
     output_dir = IMAGES_DIR / entity_type
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -252,22 +121,17 @@ def scrape_entity_type(entity_type, wiki_path):
     downloaded = 0
     matched = set()
 
-    for img_name, img_url in parser.images:
-        entity_id = match_image_to_entity(img_name, name_to_id)
-
-        if entity_id and entity_id not in matched:
-            ext_match = re.search(r'\.(png|jpg|jpeg|gif)', img_url, re.IGNORECASE)
-            ext = ext_match.group(1).lower() if ext_match else "png"
-
-            save_path = output_dir / f"{entity_id}.{ext}"
+    candidates = {}
+    for img_name, img_url in images:
+        entity_id = match_image_to_entity(img_name, matcher)
 
-            print(f"  ✓ {img_name} -> {entity_id}.{ext}")
+        if entity_id:
+            save_path = output_dir / f"{entity_id}.{image_ext(img_url)}"
+            candidates.setdefault(entity_id, []).append((img_url, save_path, img_name))
 
-            if download_image(img_url, save_path):
-                downloaded += 1
-                matched.add(entity_id)
-
-            time.sleep(DELAY_BETWEEN_REQUESTS)
+    saved = download_and_report(candidates, "✓ ")
+    downloaded += len(saved)
+    matched.update(saved)
 
     # Try individual pages for remaining missing items
     still_missing = [eid for eid in missing_ids if eid not in matched]
@@ -275,34 +139,35 @@ def scrape_entity_type(entity_type, wiki_path):
     if still_missing and len(still_missing) <= 30:  # Only try individual pages if not too many
         print(f"\n  Trying individual wiki pages for {len(still_missing)} missing items...")
 
+        # Convert IDs to wiki page names, leaving out pages that came up empty
+        # on a recent run, and fetch the pages concurrently
+        candidates = []
         for entity_id in still_missing:
-            # Convert ID to wiki page name
             page_name = entity_id.replace('_', ' ').title().replace(' ', '_')
             page_url = f"{BASE_URL}/wiki/{page_name}"
+            if not seen_recently(page_url):
+                candidates.append((entity_id, page_name, page_url))
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            pages = list(executor.map(fetch_page, [page_url for _, _, page_url in candidates]))
 
-            html = fetch_page(page_url)
+        page_candidates = {}
+        for (entity_id, page_name, page_url), html in zip(candidates, pages):
             if html:
-                parser = WikiImageParser()
-                parser.feed(html)
-
-                # Look for the first suitable image
-                for img_name, img_url in parser.images:
+                page_images = extract_wiki_images(html)
+                if not page_images:
+                    mark_seen(page_url)
+
+                # Suitable images in page order; the first that downloads wins
+                page_candidates[entity_id] = [
+                    (img_url, output_dir / f"{entity_id}.{image_ext(img_url)}", page_name)
+                    for img_name, img_url in page_images
                     # Skip tiny icons
-                    if 'icon' in img_url.lower() and '32' in img_url:
-                        continue
-
-                    ext_match = re.search(r'\.(png|jpg|jpeg|gif)', img_url, re.IGNORECASE)
-                    ext = ext_match.group(1).lower() if ext_match else "png"
+                    if not ('icon' in img_url.lower() and '32' in img_url)
+                ]
 
-                    save_path = output_dir / f"{entity_id}.{ext}"
-
-                    if download_image(img_url, save_path):
-                        print(f"  ✓ [page] {page_name} -> {entity_id}.{ext}")
-                        downloaded += 1
-                        matched.add(entity_id)
-                        break
-
-                time.sleep(DELAY_BETWEEN_REQUESTS)
+        saved = download_and_report(page_candidates, "✓ [page] ")
+        downloaded += len(saved)
+        matched.update(saved)
 
     print(f"\n  Downloaded {downloaded} new images for {entity_type}")
     return downloaded
@@ -319,55 +184,41 @@ def update_json_with_images():
         if not json_path.exists():
             continue
 
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        data = load_json(json_path)
 
         img_dir = IMAGES_DIR / entity_type
         if not img_dir.exists():
             continue
 
         # Get available images
-        images = {}
-        for img_file in img_dir.iterdir():
-            if img_file.is_file():
-                images[img_file.stem] = f"images/{entity_type}/{img_file.name}"
+        images = {
+            stem: f"images/{entity_type}/{filename}"
+            for stem, filename in scan_images(img_dir).items()
+        }
 
         # Update entities
-        updated = 0
-        for entity in data.get(entity_type, []):
-            entity_id = entity.get("id", "")
-            if entity_id in images:
-                entity["image"] = images[entity_id]
-                updated += 1
-            else:
-                entity.pop("image", None)
+        updated = attach_images(data.get(entity_type, []), images, drop_missing=True)
 
-        with open(json_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        written = write_json(json_path, data)
 
-        print(f"  {entity_type}: {updated} entities with images")
+        print(f"  {entity_type}: {updated} entities with images{'' if written else ' (unchanged)'}")
 
 
-def main():
-    print("="*60)
-    print("MegaBonk Image Scraper v2 - Improved Matching")
-    print("="*60)
-
+def run():
+    """Scrape every entity type; returns how many new images were downloaded."""
     total_downloaded = 0
 
+    listings = fetch_listing_images(BASE_URL, WIKI_PAGES)
+
     for entity_type, wiki_path in WIKI_PAGES.items():
-        count = scrape_entity_type(entity_type, wiki_path)
+        count = scrape_entity_type(entity_type, wiki_path, listings[entity_type])
         total_downloaded += count
-        time.sleep(1)
 
-    print(f"\n{'='*60}")
-    print(f"Downloaded {total_downloaded} new images")
-    print(f"{'='*60}")
+    return total_downloaded
 
-    # Update JSON files
-    update_json_with_images()
 
-    # Show final counts
+def print_image_counts():
+    """Show how many images each entity type has on disk."""
     print(f"\n{'='*60}")
     print("Final image counts:")
     print(f"{'='*60}")
@@ -378,5 +229,23 @@ def main():
             print(f"  {entity_type}: {count} images")
 
 
+def main():
+    print("="*60)
+    print("MegaBonk Image Scraper v2 - Improved Matching")
+    print("="*60)
+
+    total_downloaded = run()
+
+    print(f"\n{'='*60}")
+    print(f"Downloaded {total_downloaded} new images")
+    print(f"{'='*60}")
+
+    # Update JSON files
+    update_json_with_images()
+
+    # Show final counts
+    print_image_counts()
+
+
 if __name__ == "__main__":
     main()
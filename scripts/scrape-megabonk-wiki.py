@@ -4,13 +4,25 @@ Scrape images from megabonk.wiki (the official community wiki).
 This wiki has better image coverage than the Fandom wiki.
 """
 
+import functools
+import heapq
 import os
 import re
-import json
-import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from html.parser import HTMLParser
+
+from _scraper_core import (
+    MAX_WORKERS,
+    NameMatcher,
+    download_and_report,
+    download_image as _download_cached,
+    fetch_page,
+    iter_img_attrs,
+    load_json,
+    normalize_name,
+    warn,
+    write_json,
+)
 
 BASE_URL = "https://megabonk.wiki"
 WIKI_PAGES = {
@@ -25,129 +37,115 @@ PROJECT_DIR = SCRIPT_DIR.parent
 DATA_DIR = PROJECT_DIR / "data"
 IMAGES_DIR = PROJECT_DIR / "src" / "images"
 
-DELAY = 0.3
-
-
-class WikiImageParser(HTMLParser):
-    """Parse wiki page to extract image URLs."""
-
-    def __init__(self):
-        super().__init__()
-        self.images = []  # List of (name, url) tuples
-
-    def handle_starttag(self, tag, attrs):
-        if tag == "img":
-            attrs_dict = dict(attrs)
-            src = attrs_dict.get("src", "")
-            alt = attrs_dict.get("alt", "")
-
-            # Skip tiny icons, logos, and UI elements
-            if any(skip in src.lower() for skip in ["logo", "icon-", "ui_", "stat_", "rarity"]):
-                return
-
-            # Look for item/weapon/tome images
-            if "/images/" in src and not src.endswith(".svg"):
-                # Build full URL
-                if src.startswith("/"):
-                    full_url = BASE_URL + src
-                elif src.startswith("http"):
-                    full_url = src
-                else:
-                    return
-
-                # Get name from alt text or filename
-                name = alt if alt else self._extract_name_from_url(src)
-                if name:
-                    self.images.append((name, full_url))
-
-    def _extract_name_from_url(self, url):
-        """Extract item name from image URL."""
-        # Pattern: /images/x/xx/Item_Name.png or /images/thumb/x/xx/Item_Name.png/...
-        match = re.search(r'/([^/]+)\.(png|jpg|jpeg|gif|webp)', url, re.IGNORECASE)
-        if match:
-            name = match.group(1)
-            # Remove common prefixes
-            for prefix in ["Item_", "Weapon_", "Tome_", "Character_"]:
-                if name.startswith(prefix):
-                    name = name[len(prefix):]
-            name = name.replace("_", " ").replace("-", " ")
-            return name
-        return None
-
-
-def normalize_name(name):
-    """Normalize a name for matching."""
-    if not name:
-        return ""
-    normalized = name.lower().strip()
-    normalized = re.sub(r'[^a-z0-9\s]', '', normalized)
-    normalized = re.sub(r'\s+', ' ', normalized)
-    return normalized
+# Precompiled patterns for the per-image and per-name loops
+_IMG_NAME_RE = re.compile(r'/([^/]+)\.(png|jpg|jpeg|gif|webp)', re.IGNORECASE)
+_EXT_RE = re.compile(r'\.(png|jpg|jpeg|gif|webp)', re.IGNORECASE)
+_PARENS_RE = re.compile(r'\s*\([^)]*\)')
+_URL_PREFIXES = ("Item_", "Weapon_", "Tome_", "Character_")
+_URL_TRANS = str.maketrans("_-", "  ")
+
+
+def _extract_name_from_url(url):
+    """Extract item name from image URL."""
+    # Pattern: /images/x/xx/Item_Name.png or /images/thumb/x/xx/Item_Name.png/...
+    match = _IMG_NAME_RE.search(url)
+    if match:
+        name = match.group(1)
+        # Remove a common prefix; each one ends at the name's first underscore
+        if name.startswith(_URL_PREFIXES):
+            name = name.partition("_")[2]
+        return name.translate(_URL_TRANS)
+    return None
+
+
+def extract_images(html):
+    """Extract (name, url) pairs for the entity images on a wiki page."""
+    images = []
+    for attrs in iter_img_attrs(html):
+        src = attrs.get("src", "")
+        alt = attrs.get("alt", "")
+
+        # Skip tiny icons, logos, and UI elements
+        if any(skip in src.lower() for skip in ["logo", "icon-", "ui_", "stat_", "rarity"]):
+            continue
+
+        # Look for item/weapon/tome images
+        if "/images/" in src and not src.endswith(".svg"):
+            # Build full URL
+            if src.startswith("/"):
+                full_url = BASE_URL + src
+            elif src.startswith("http"):
+                full_url = src
+            else:
+                continue
+
+            # Get name from alt text or filename
+            name = alt if alt else _extract_name_from_url(src)
+            if name:
+                images.append((name, full_url))
+    return images
 
 
 def create_id_from_name(name):
     """Convert display name to ID format."""
-    if not name:
-        return ""
-    # Convert to lowercase, replace spaces with underscores
-    id_form = name.lower().strip()
-    id_form = re.sub(r'[^a-z0-9\s]', '', id_form)
-    id_form = re.sub(r'\s+', '_', id_form)
-    return id_form
-
-
-def fetch_page(url):
-    """Fetch a web page."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) MegaBonkGuide/1.0"
-    }
-    request = urllib.request.Request(url, headers=headers)
+    # normalize_name leaves single spaces between words; IDs use underscores
+    return normalize_name(name).replace(" ", "_")
+
+
+def _unwanted_size(size, verbose):
+    """Whether an image of this many bytes is a placeholder or the wiki logo."""
+    # Skip if too small (likely placeholder)
+    if size < 500:
+        return True
+
+    # Skip if it's the wiki logo (check for consistent size)
+    if size == 5320:
+        if verbose:
+            warn("    Skipping wiki logo")
+        return True
+    return False
 
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            return response.read().decode('utf-8')
-    except Exception as e:
-        print(f"  Error fetching {url}: {e}")
-        return None
 
+def download_image(url, save_path, verbose=True):
+    """Download an image unless it turns out to be a placeholder or the logo.
 
-def download_image(url, save_path):
-    """Download an image."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) MegaBonkGuide/1.0"
-    }
-    request = urllib.request.Request(url, headers=headers)
+    Goes through the shared image cache, so validators are kept for every
+    saved image and a rejected URL is not requested again for a week.
+    """
+    return _download_cached(url, save_path, verbose,
+                            reject=functools.partial(_unwanted_size, verbose=verbose))
 
+
+@functools.lru_cache(maxsize=None)
+def _image_files(entity_type):
+    """Filenames in an entity type's image directory, from one os.scandir.
+
+    Call _image_files.cache_clear() once new images have been saved.
+    """
     try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            data = response.read()
+        with os.scandir(IMAGES_DIR / entity_type) as entries:
+            return tuple(entry.name for entry in entries if entry.is_file())
+    except FileNotFoundError:
+        return ()
 
-            # Skip if too small (likely placeholder)
-            if len(data) < 500:
-                return False
 
-            # Skip if it's the wiki logo (check for consistent size)
-            if len(data) == 5320:
-                print(f"    Skipping wiki logo")
-                return False
+@functools.lru_cache(maxsize=None)
+def _load_json(path_str):
+    """Parse a data file once; later calls share the parsed object.
 
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(save_path, 'wb') as f:
-                f.write(data)
-            return True
-    except Exception as e:
-        print(f"  Error downloading {url}: {e}")
-        return False
+    Call _load_json.cache_clear() to pick up changes made on disk.
+    """
+    return load_json(path_str)
 
 
+@functools.lru_cache(maxsize=None)
 def load_entity_ids(entity_type):
     """Load entity IDs from JSON."""
     json_file = DATA_DIR / f"{entity_type}.json"
     if not json_file.exists():
         return {}
 
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+    data = _load_json(str(json_file))
 
     # Create mapping: various name forms -> entity_id
     name_to_id = {}
@@ -167,40 +165,39 @@ def load_entity_ids(entity_type):
         if "'" in entity_name:
             name_to_id[normalize_name(entity_name.replace("'", ""))] = entity_id
         if "(" in entity_name:
-            name_to_id[normalize_name(re.sub(r'\s*\([^)]*\)', '', entity_name))] = entity_id
+            name_to_id[normalize_name(_PARENS_RE.sub('', entity_name))] = entity_id
 
     return name_to_id
 
 
-def match_image_to_entity(img_name, name_to_id):
-    """Try to match an image name to an entity ID."""
+def match_image_to_entity(img_name, matcher):
+    """Try to match an image name to an entity ID.
+
+    matcher is the entity type's NameMatcher, built once per type.
+    """
     # Direct match
     normalized = normalize_name(img_name)
-    if normalized in name_to_id:
-        return name_to_id[normalized]
+    if normalized in matcher.name_to_id:
+        return matcher.name_to_id[normalized]
 
     # Try without common prefixes/suffixes
     for prefix in ["item ", "weapon ", "tome ", "character "]:
         if normalized.startswith(prefix):
             clean = normalized[len(prefix):]
-            if clean in name_to_id:
-                return name_to_id[clean]
+            if clean in matcher.name_to_id:
+                return matcher.name_to_id[clean]
 
     # Try ID form
     id_form = create_id_from_name(img_name)
-    if id_form in name_to_id:
-        return name_to_id[id_form]
+    if id_form in matcher.name_to_id:
+        return matcher.name_to_id[id_form]
 
-    # Partial match
-    for name, entity_id in name_to_id.items():
-        if len(name) > 3 and len(normalized) > 3:
-            if name in normalized or normalized in name:
-                return entity_id
+    # Partial match: an entity name inside the image name or the other way
+    # round, answered from the matcher's indexes
+    return matcher.partial_match(normalized)
 
-    return None
 
-
-def scrape_entity_type(entity_type, wiki_path):
+def scrape_entity_type(entity_type, wiki_path, html):
     """Scrape images for a specific entity type."""
     print(f"\n{'='*60}")
     print(f"Scraping {entity_type.upper()} from megabonk.wiki")
@@ -212,33 +209,30 @@ def scrape_entity_type(entity_type, wiki_path):
         return 0
 
     # Check existing images
-    img_dir = IMAGES_DIR / entity_type
-    existing = set()
-    if img_dir.exists():
-        existing = {f.stem for f in img_dir.iterdir() if f.is_file()}
+    existing = {os.path.splitext(name)[0] for name in _image_files(entity_type)}
 
     print(f"  {len(existing)} images already exist")
 
-    # Fetch wiki page
+    # Wiki page is fetched up front by fetch_pages()
     url = BASE_URL + wiki_path
-    print(f"  Fetching: {url}")
-
-    html = fetch_page(url)
     if not html:
+        print(f"  Failed to fetch {url}")
         return 0
+    print(f"  Fetched: {url}")
 
-    parser = WikiImageParser()
-    parser.feed(html)
-    print(f"  Found {len(parser.images)} images on page")
+    images = extract_images(html)
+    print(f"  Found {len(images)} images on page")
 
     output_dir = IMAGES_DIR / entity_type
     output_dir.mkdir(parents=True, exist_ok=True)
 
     downloaded = 0
     matched = set()
+    matcher = NameMatcher(name_to_id)
 
-    for img_name, img_url in parser.images:
-        entity_id = match_image_to_entity(img_name, name_to_id)
+    candidates = {}
+    for img_name, img_url in images:
+        entity_id = match_image_to_entity(img_name, matcher)
 
         if entity_id and entity_id not in matched:
             # Skip if already have this image
@@ -247,25 +241,22 @@ def scrape_entity_type(entity_type, wiki_path):
                 continue
 
             # Determine extension
-            ext_match = re.search(r'\.(png|jpg|jpeg|gif|webp)', img_url, re.IGNORECASE)
+            ext_match = _EXT_RE.search(img_url)
             ext = ext_match.group(1).lower() if ext_match else "png"
 
             save_path = output_dir / f"{entity_id}.{ext}"
+            candidates.setdefault(entity_id, []).append((img_url, save_path, img_name))
 
-            print(f"  Downloading: {img_name} -> {entity_id}.{ext}")
-
-            if download_image(img_url, save_path):
-                downloaded += 1
-                matched.add(entity_id)
-
-            time.sleep(DELAY)
+    saved = download_and_report(candidates, "Downloaded: ", download=download_image)
+    downloaded += len(saved)
+    matched.update(saved)
 
     # Report missing
     all_ids = set(name_to_id.values())
     still_missing = all_ids - existing - matched
     if still_missing:
         print(f"\n  Still missing {len(still_missing)} images:")
-        for mid in sorted(still_missing)[:10]:
+        for mid in heapq.nsmallest(10, still_missing):
             print(f"    - {mid}")
         if len(still_missing) > 10:
             print(f"    ... and {len(still_missing) - 10} more")
@@ -285,35 +276,45 @@ def update_json_with_images():
         if not json_path.exists():
             continue
 
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        # Updated in place, so the cached parse stays in step with the file
+        data = _load_json(str(json_path))
 
         img_dir = IMAGES_DIR / entity_type
         if not img_dir.exists():
             continue
 
         # Get available images
-        images = {}
-        for img_file in img_dir.iterdir():
-            if img_file.is_file():
-                images[img_file.stem] = f"images/{entity_type}/{img_file.name}"
+        images = {
+            os.path.splitext(name)[0]: f"images/{entity_type}/{name}"
+            for name in _image_files(entity_type)
+        }
 
-        # Update entities
+        # Update entities, noting whether any image field actually changed
         updated = 0
         total = 0
+        dirty = False
         for entity in data.get(entity_type, []):
             total += 1
             entity_id = entity.get("id", "")
             if entity_id in images:
-                entity["image"] = images[entity_id]
+                if entity.get("image") != images[entity_id]:
+                    entity["image"] = images[entity_id]
+                    dirty = True
                 updated += 1
-            else:
-                entity.pop("image", None)
+            elif entity.pop("image", None) is not None:
+                dirty = True
 
-        with open(json_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Nothing to serialize on a re-run that found no new images
+        written = dirty and write_json(json_path, data)
 
-        print(f"  {entity_type}: {updated}/{total} entities with images")
+        print(f"  {entity_type}: {updated}/{total} entities with images{'' if written else ' (unchanged)'}")
+
+
+def fetch_pages():
+    """Fetch every category page concurrently, keyed like WIKI_PAGES."""
+    urls = [BASE_URL + wiki_path for wiki_path in WIKI_PAGES.values()]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return dict(zip(WIKI_PAGES, executor.map(fetch_page, urls)))
 
 
 def main():
@@ -324,16 +325,20 @@ def main():
 
     total_downloaded = 0
 
+    pages = fetch_pages()
+
     for entity_type, wiki_path in WIKI_PAGES.items():
-        count = scrape_entity_type(entity_type, wiki_path)
+        count = scrape_entity_type(entity_type, wiki_path, pages[entity_type])
         total_downloaded += count
-        time.sleep(1)
 
     print(f"\n{'='*60}")
     print(f"Downloaded {total_downloaded} new images")
     print(f"{'='*60}")
 
-    # Update JSON files
+    # Update JSON files, starting from a fresh read of each and a fresh
+    # listing of the image directories
+    _load_json.cache_clear()
+    _image_files.cache_clear()
     update_json_with_images()
 
     # Show final counts
@@ -343,12 +348,11 @@ def main():
     for entity_type in WIKI_PAGES.keys():
         dir_path = IMAGES_DIR / entity_type
         if dir_path.exists():
-            count = len([f for f in dir_path.iterdir() if f.is_file()])
+            count = len(_image_files(entity_type))
             json_path = DATA_DIR / f"{entity_type}.json"
             total = 0
             if json_path.exists():
-                with open(json_path) as f:
-                    total = len(json.load(f).get(entity_type, []))
+                total = len(_load_json(str(json_path)).get(entity_type, []))
             print(f"  {entity_type}: {count}/{total} images")
 
 
@@ -3,10 +3,10 @@
 Update JSON data files with image paths for downloaded images.
 """
 
-import os
-import json
 from pathlib import Path
 
+from _json_helpers import attach_images, load_json, scan_images, write_json
+
 # Directories
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_DIR = SCRIPT_DIR.parent
@@ -20,16 +20,11 @@ def get_available_images(entity_type):
     if not images_path.exists():
         return {}
 
-    images = {}
-    for img_file in images_path.iterdir():
-        if img_file.is_file():
-            # ID is filename without extension
-            entity_id = img_file.stem
-            # Path relative to src/ directory
-            rel_path = f"images/{entity_type}/{img_file.name}"
-            images[entity_id] = rel_path
-
-    return images
+    # ID is filename without extension; path is relative to src/ directory
+    return {
+        entity_id: f"images/{entity_type}/{filename}"
+        for entity_id, filename in scan_images(images_path).items()
+    }
 
 
 def update_json_file(entity_type, list_key):
@@ -41,31 +36,20 @@ def update_json_file(entity_type, list_key):
         return 0
 
     # Load JSON
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    data = load_json(json_path)
 
     # Get available images
     images = get_available_images(entity_type)
     print(f"  Found {len(images)} images for {entity_type}")
 
-    # Update entities
+    # Update entities, removing the image field where no image exists
     entities = data.get(list_key, [])
-    updated = 0
-
-    for entity in entities:
-        entity_id = entity.get("id", "")
-        if entity_id in images:
-            entity["image"] = images[entity_id]
-            updated += 1
-        else:
-            # Remove image field if no image exists
-            entity.pop("image", None)
-
-    # Save updated JSON
-    with open(json_path, 'w') as f:
-        json.dump(data, f, indent=2)
-
-    print(f"  Updated {updated}/{len(entities)} entities with images")
+    updated = attach_images(entities, images, drop_missing=True)
+
+    # Save updated JSON (left untouched if nothing changed)
+    written = write_json(json_path, data)
+
+    print(f"  Updated {updated}/{len(entities)} entities with images{'' if written else ' (file unchanged)'}")
     return updated
 
 
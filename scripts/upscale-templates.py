@@ -2,9 +2,22 @@
 """
 Upscale item template images from 32x32 to 64x64 for better CV detection.
 Uses Lanczos resampling for high-quality pixel art upscaling.
+
+Templates are processed in parallel with one worker process per CPU.
+If OpenCV is installed (pip install opencv-python-headless) its SIMD
+Lanczos resize is used instead of Pillow's; otherwise installing Pillow-SIMD
+(pip install pillow-simd, a drop-in replacement for Pillow) speeds up the
+resampling itself as well.
+
+PNGs are written with plain zlib compression so iterating stays fast; pass
+--release to recompress them losslessly with oxipng afterwards.
 """
 
 import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -13,12 +26,90 @@ except ImportError:
     print("Error: PIL/Pillow is required. Install with: pip install Pillow")
     exit(1)
 
+# Optional: faster Lanczos resampling
+try:
+    import cv2
+    import numpy as np
+    HAS_CV2 = True
+except ImportError:
+    HAS_CV2 = False
+
 # Configuration
 INPUT_DIR = Path(__file__).parent.parent / 'src' / 'images' / 'items'
 TARGET_SIZE = (64, 64)
+RELEASE = '--release' in sys.argv[1:]
+
+# Modes OpenCV can resize as plain arrays; palette and 1-bit images go
+# through Pillow, which resizes those with nearest neighbour anyway
+CV2_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+def _resize(img):
+    """Lanczos-resize a PIL image to TARGET_SIZE, with OpenCV when available."""
+    if HAS_CV2 and img.mode in CV2_MODES:
+        # The decoded pixels go straight to cv2 and back, so channels stay
+        # in Pillow's order and the mode is unchanged
+        arr = np.asarray(img, dtype=np.float32)
+        has_alpha = img.mode in ('LA', 'RGBA')
+        if has_alpha:
+            # Premultiply by alpha as Pillow does, so the colour of fully
+            # transparent pixels doesn't darken the sprite's edges
+            alpha = arr[..., -1:]
+            arr = np.concatenate([arr[..., :-1] * (alpha / 255), alpha], axis=-1)
+
+        resized = cv2.resize(arr, TARGET_SIZE, interpolation=cv2.INTER_LANCZOS4)
+
+        if has_alpha:
+            alpha = np.clip(resized[..., -1:], 0, 255)
+            color = np.divide(resized[..., :-1] * 255, alpha,
+                              out=np.zeros_like(resized[..., :-1]), where=alpha > 0)
+            resized = np.concatenate([color, alpha], axis=-1)
+        return Image.fromarray(np.clip(resized, 0, 255).round().astype(np.uint8))
+    return img.resize(TARGET_SIZE, Image.LANCZOS)
+
+def _process_one(png_path):
+    """Upscale one template in place and write its WebP version.
+
+    Both outputs are encoded from the same decoded image. Returns
+    (status, report line).
+    """
+    webp_path = png_path.with_suffix('.webp')
+
+    try:
+        img = Image.open(png_path)
+        original_size = img.size
+
+        if original_size == TARGET_SIZE:
+            # Already upscaled; nothing to do unless the WebP is out of date
+            if webp_path.exists() and webp_path.stat().st_mtime >= png_path.stat().st_mtime:
+                return "skip", f"SKIP: {png_path.name} (already {TARGET_SIZE[0]}x{TARGET_SIZE[1]}, WebP up to date)"
+            upscaled = img
+            status = "webp"
+            line = f"WEBP: {webp_path.name} (PNG already {TARGET_SIZE[0]}x{TARGET_SIZE[1]})"
+        else:
+            # Use LANCZOS for high-quality upscaling (best for pixel art);
+            # resize keeps the mode, so an alpha channel survives as is
+            upscaled = _resize(img)
+
+            # Save back to same location
+            upscaled.save(png_path, 'PNG', compress_level=6)
+            status = "ok"
+            line = f"OK: {png_path.name} ({original_size[0]}x{original_size[1]} -> {TARGET_SIZE[0]}x{TARGET_SIZE[1]}) + {webp_path.name}"
+
+        # Convert to RGBA for WebP with transparency
+        if upscaled.mode != 'RGBA':
+            upscaled = upscaled.convert('RGBA')
+
+        # Save as WebP with good quality (method 6 takes far longer for
+        # next to no saving on 64x64 icons)
+        upscaled.save(webp_path, 'WEBP', quality=90, lossless=True, method=4)
+
+        return status, line
+
+    except Exception as e:
+        return "error", f"ERROR: {png_path.name} - {e}"
 
 def upscale_templates():
-    """Upscale all PNG templates to target size."""
+    """Upscale all PNG templates to target size and regenerate their WebP versions."""
     if not INPUT_DIR.exists():
         print(f"Error: Directory not found: {INPUT_DIR}")
         return False
@@ -33,91 +124,48 @@ def upscale_templates():
     print(f"Target size: {TARGET_SIZE[0]}x{TARGET_SIZE[1]}")
     print("-" * 40)
 
-    success_count = 0
-    skip_count = 0
-    error_count = 0
-
-    for png_path in sorted(png_files):
-        try:
-            img = Image.open(png_path)
-            original_size = img.size
+    counts = {"ok": 0, "webp": 0, "skip": 0, "error": 0}
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # Results come back in input order, so the report stays sorted
+        for status, line in executor.map(_process_one, sorted(png_files), chunksize=8):
+            print(line)
+            counts[status] += 1
 
-            # Skip if already at target size
-            if original_size == TARGET_SIZE:
-                print(f"SKIP: {png_path.name} (already {TARGET_SIZE[0]}x{TARGET_SIZE[1]})")
-                skip_count += 1
-                continue
-
-            # Use LANCZOS for high-quality upscaling (best for pixel art)
-            upscaled = img.resize(TARGET_SIZE, Image.LANCZOS)
-
-            # Preserve alpha channel if present
-            if img.mode == 'RGBA':
-                upscaled = upscaled.convert('RGBA')
-
-            # Save back to same location
-            upscaled.save(png_path, 'PNG', optimize=True)
-
-            print(f"OK: {png_path.name} ({original_size[0]}x{original_size[1]} -> {TARGET_SIZE[0]}x{TARGET_SIZE[1]})")
-            success_count += 1
-
-        except Exception as e:
-            print(f"ERROR: {png_path.name} - {e}")
-            error_count += 1
-
-    print("-" * 40)
-    print(f"Done: {success_count} upscaled, {skip_count} skipped, {error_count} errors")
-
-    return error_count == 0
-
-def regenerate_webp():
-    """Regenerate WebP versions of all PNG templates."""
-    png_files = list(INPUT_DIR.glob('*.png'))
-
-    print("\nRegenerating WebP versions...")
     print("-" * 40)
+    print(f"Done: {counts['ok']} upscaled, {counts['webp']} WebP only, "
+          f"{counts['skip']} skipped, {counts['error']} errors")
 
-    success_count = 0
-    error_count = 0
+    return counts['error'] == 0
 
-    for png_path in sorted(png_files):
-        webp_path = png_path.with_suffix('.webp')
-
-        try:
-            img = Image.open(png_path)
-
-            # Convert to RGBA for WebP with transparency
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-
-            # Save as WebP with good quality
-            img.save(webp_path, 'WEBP', quality=90, lossless=True)
-
-            print(f"OK: {webp_path.name}")
-            success_count += 1
-
-        except Exception as e:
-            print(f"ERROR: {webp_path.name} - {e}")
-            error_count += 1
+def optimize_pngs():
+    """Losslessly recompress every PNG template with oxipng (release builds)."""
+    oxipng = shutil.which('oxipng')
+    if not oxipng:
+        print("Error: oxipng is required for --release. Install with: cargo install oxipng")
+        return False
 
-    print("-" * 40)
-    print(f"Done: {success_count} WebP files regenerated, {error_count} errors")
+    png_files = sorted(INPUT_DIR.glob('*.png'))
+    print(f"\nOptimizing {len(png_files)} PNG files with oxipng...")
 
-    return error_count == 0
+    # oxipng works through the files in parallel itself; --preserve keeps
+    # the timestamps so the WebP versions still count as up to date
+    result = subprocess.run([oxipng, '--opt', '4', '--strip', 'safe', '--preserve', '--quiet',
+                             *map(str, png_files)])
+    return result.returncode == 0
 
 if __name__ == '__main__':
     print("=" * 40)
     print("Template Upscaling Script")
     print("=" * 40)
 
-    # Step 1: Upscale PNGs
-    png_ok = upscale_templates()
+    # Upscale PNGs and regenerate their WebP versions in one pass
+    ok = upscale_templates()
 
-    # Step 2: Regenerate WebP versions
-    webp_ok = regenerate_webp()
+    if ok and RELEASE:
+        ok = optimize_pngs()
 
     print("\n" + "=" * 40)
-    if png_ok and webp_ok:
+    if ok:
         print("All done! Templates are now 64x64.")
         print("Restart dev server to see changes.")
     else:
@@ -7,6 +7,8 @@ Usage:
     python3 serve.py         # Launch on default port 8000
     python3 serve.py 3000    # Launch on custom port
 
+Run scripts/precompress.py first to serve text assets gzip/brotli encoded.
+
 Access from phone:
     1. Make sure your computer and phone are on the same WiFi
     2. Run this script
@@ -14,7 +16,9 @@ Access from phone:
     4. Open that URL on your phone
 """
 
+import functools
 import http.server
+import io
 import socketserver
 import sys
 import socket
@@ -27,16 +31,16 @@ try:
 except ImportError:
     HAS_QRCODE = False
 
-# Change to the src directory where index.html is located
+# Serve the src directory where index.html is located
 script_dir = Path(__file__).parent
 src_dir = script_dir / "src"
+# Compressed copies of src/ written by scripts/precompress.py
+precompressed_dir = script_dir / ".precompressed"
 
 if not src_dir.exists():
     print(f"❌ Error: {src_dir} directory not found!")
     sys.exit(1)
 
-os.chdir(src_dir)
-
 # Get port from command line or use default
 PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
 
@@ -61,13 +65,89 @@ Handler = http.server.SimpleHTTPRequestHandler
 
 # Add CORS headers for development
 class CORSRequestHandler(Handler):
+    # Keep-alive, so the page's many small asset requests reuse connections
+    protocol_version = 'HTTP/1.1'
+
+    # Encodings of the precompressed copies, best first
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    # Set by send_head when the file has a precompressed copy, so the
+    # response says it depends on Accept-Encoding even when sent as-is
+    vary = False
+
+    def accepted_encodings(self):
+        # Codings the client takes, by q-value; q=0 is an explicit refusal
+        weights = {}
+        for token in self.headers.get('Accept-Encoding', '').split(','):
+            coding, *params = token.split(';')
+            q = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if coding.strip():
+                weights[coding.strip().lower()] = q
+        return {
+            encoding for encoding, _ in self.ENCODINGS
+            if weights.get(encoding, weights.get('*', 0.0)) > 0
+        }
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        rel_path = os.path.relpath(path, src_dir)
+        if os.path.isfile(path) and not rel_path.startswith(os.pardir):
+            accepted = self.accepted_encodings()
+            for encoding, suffix in self.ENCODINGS:
+                compressed = os.path.join(precompressed_dir, rel_path) + suffix
+                # Ignore a compressed copy older than the file it was made from
+                if (os.path.isfile(compressed)
+                        and os.path.getmtime(compressed) >= os.path.getmtime(path)):
+                    self.vary = True
+                    if encoding in accepted:
+                        return self.send_compressed(path, compressed, encoding)
+        return super().send_head()
+
+    def send_compressed(self, path, compressed, encoding):
+        try:
+            f = open(compressed, 'rb')
+        except OSError:
+            return super().send_head()
+        fs = os.fstat(f.fileno())
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(fs.st_size))
+        self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+        self.end_headers()
+        return f
+
     def end_headers(self):
+        if self.vary:
+            self.send_header('Vary', 'Accept-Encoding')
+            self.vary = False
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
         super().end_headers()
 
+    def copyfile(self, source, outputfile):
+        # Hand regular files to the kernel with sendfile() instead of
+        # copying them through Python a buffer at a time
+        if isinstance(source, io.BufferedReader) and hasattr(os, 'sendfile'):
+            self.connection.sendfile(source)
+        else:
+            super().copyfile(source, outputfile)
+
+# One thread per connection, so the browser's parallel keep-alive
+# connections are served side by side instead of one at a time
+class DevServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
 print("\n" + "="*60)
 print("🎮 MegaBonk Complete Guide - Server Starting...")
 print("="*60)
@@ -95,7 +175,8 @@ try:
     print(f"   Press Ctrl+C to stop")
     print("\n" + "="*60 + "\n")
 
-    with socketserver.TCPServer(("", PORT), CORSRequestHandler) as httpd:
+    handler = functools.partial(CORSRequestHandler, directory=str(src_dir))
+    with DevServer(("", PORT), handler) as httpd:
         httpd.serve_forever()
 
 except KeyboardInterrupt: